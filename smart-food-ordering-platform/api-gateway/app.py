@@ -3,13 +3,25 @@ API Gateway Service
 Central entry point for all microservices - implements API Gateway pattern
 """
 
-from flask import Flask, request, jsonify
+# Cooperative sockets for gunicorn gevent workers - must run before other imports
+from gevent import monkey
+monkey.patch_all()
+
+from flask import Flask, request, Response
 from flask_cors import CORS
 import requests
+from requests.adapters import HTTPAdapter
 import grpc
+import grpc.experimental.gevent as grpc_gevent
 import os
 import jwt
+import orjson
+import time
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from functools import wraps
+from cachetools import TTLCache
 import sys
 sys.path.append('./proto')
 
@@ -20,8 +32,11 @@ try:
 except ImportError:
     print("Warning: gRPC files not generated yet. Run: python -m grpc_tools.protoc")
 
+# Let gRPC calls yield to the gevent hub instead of blocking the worker
+grpc_gevent.init_gevent()
+
 app = Flask(__name__)
-CORS(app)
+CORS(app, expose_headers=['X-Next-Cursor'])
 
 # Service URLs from environment variables
 USER_SERVICE_URL = os.getenv('USER_SERVICE_URL', 'http://localhost:5001')
@@ -31,38 +46,120 @@ RECOMMENDATION_SERVICE_URL = os.getenv('RECOMMENDATION_SERVICE_URL', 'http://loc
 
 JWT_SECRET = os.getenv('JWT_SECRET', 'your-secret-key-change-in-production')
 
+# Plausible compact-JWS length bounds (header.payload.signature)
+JWT_MIN_LENGTH = 20
+JWT_MAX_LENGTH = 4096
+
+# Preconfigured decoder - avoids per-call option/algorithm resolution
+JWT_ALGORITHMS = ['HS256']
+_jwt = jwt.PyJWT(options={'require': ['exp']})
+_jwt_decode = _jwt.decode
+
+# Verified JWT cache - keyed by SHA-256 of the token, never stores failures
+JWT_CACHE_TTL = 30  # seconds
+_jwt_cache = TTLCache(maxsize=10000, ttl=JWT_CACHE_TTL)
+_jwt_cache_lock = threading.Lock()
+
+# Persistent HTTP sessions per downstream service (keep-alive connection pools)
+def create_session():
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=32, pool_maxsize=64, max_retries=0)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers.update({'Connection': 'keep-alive'})
+    return session
+
+user_session = create_session()
+restaurant_session = create_session()
+recommendation_session = create_session()
+
+# Executor for overlapping independent downstream calls (greenlets under gevent)
+fanout_executor = ThreadPoolExecutor(max_workers=32)
+
+# Shared gRPC channel + stub - channels are thread-safe and multiplex calls over one connection
+_order_channel = grpc.insecure_channel(
+    ORDER_SERVICE_URL,
+    options=[('grpc.keepalive_time_ms', 30000)]
+)
+try:
+    _order_stub = order_pb2_grpc.OrderServiceStub(_order_channel)
+except NameError:
+    _order_stub = None
+
 # Circuit Breaker Configuration
 CIRCUIT_BREAKER_THRESHOLD = 5
 CIRCUIT_BREAKER_TIMEOUT = 60
+CIRCUIT_BREAKER_RECHECK = 1.0  # seconds between OPEN -> HALF_OPEN checks
+
+# Circuit breaker states
+CLOSED, OPEN, HALF_OPEN = 0, 1, 2
+STATE_NAMES = ('CLOSED', 'OPEN', 'HALF_OPEN')
 
 class CircuitBreaker:
-    """Simple Circuit Breaker implementation"""
+    """Simple Circuit Breaker implementation
+    
+    The state is a single int; the lock is only taken on transitions,
+    so the common CLOSED success path never contends.
+    """
     def __init__(self, threshold=5, timeout=60):
         self.threshold = threshold
         self.timeout = timeout
         self.failure_count = 0
         self.last_failure_time = None
-        self.state = 'CLOSED'  # CLOSED, OPEN, HALF_OPEN
+        self._next_check = 0.0
+        self._state = CLOSED
+        self._lock = threading.Lock()
+    
+    @property
+    def state(self):
+        return STATE_NAMES[self._state]
     
     def call(self, func, *args, **kwargs):
-        if self.state == 'OPEN':
-            if (time.time() - self.last_failure_time) > self.timeout:
-                self.state = 'HALF_OPEN'
-            else:
+        if self._state == OPEN:
+            now = time.monotonic()
+            if now < self._next_check:
+                raise Exception("Circuit breaker is OPEN")
+            if (now - self.last_failure_time) <= self.timeout:
+                self._next_check = now + CIRCUIT_BREAKER_RECHECK
                 raise Exception("Circuit breaker is OPEN")
+            with self._lock:
+                if self._state == OPEN:
+                    self._state = HALF_OPEN
         
         try:
             result = func(*args, **kwargs)
-            if self.state == 'HALF_OPEN':
-                self.state = 'CLOSED'
-                self.failure_count = 0
-            return result
-        except Exception as e:
-            self.failure_count += 1
-            self.last_failure_time = time.time()
-            if self.failure_count >= self.threshold:
-                self.state = 'OPEN'
-            raise e
+        except Exception:
+            with self._lock:
+                self.failure_count += 1
+                self.last_failure_time = time.monotonic()
+                if self.failure_count >= self.threshold:
+                    self._state = OPEN
+            raise
+        
+        if self._state != CLOSED:
+            with self._lock:
+                if self._state == HALF_OPEN:
+                    self._state = CLOSED
+                    self.failure_count = 0
+        return result
+
+# Response helpers
+def json_response(data, status=200):
+    """Serialize a gateway-built body with orjson"""
+    return Response(orjson.dumps(data), status=status, mimetype='application/json')
+
+def proxy_response(response):
+    """Pass the downstream body through untouched - no JSON decode/encode"""
+    proxied = Response(
+        response.content,
+        status=response.status_code,
+        content_type=response.headers.get('Content-Type', 'application/json')
+    )
+    # Pagination cursor from list endpoints
+    next_cursor = response.headers.get('X-Next-Cursor')
+    if next_cursor:
+        proxied.headers['X-Next-Cursor'] = next_cursor
+    return proxied
 
 # Circuit breakers for each service
 circuit_breakers = {
@@ -78,17 +175,35 @@ def require_auth(f):
     def decorated_function(*args, **kwargs):
         token = request.headers.get('Authorization')
         if not token:
-            return jsonify({'error': 'No authorization token provided'}), 401
+            return json_response({'error': 'No authorization token provided'}, 401)
+        
+        if token.startswith('Bearer '):
+            token = token[7:]
+        
+        # Reject obvious non-tokens before hashing or touching PyJWT
+        if token.count('.') != 2 or not JWT_MIN_LENGTH < len(token) < JWT_MAX_LENGTH:
+            return json_response({'error': 'Invalid token'}, 401)
+        
+        # Skip signature verification for tokens seen recently
+        key = hashlib.sha256(token.encode()).digest()
+        now = time.time()
+        with _jwt_cache_lock:
+            cached = _jwt_cache.get(key)
+        if cached and cached[1] > now:
+            request.user_id = cached[0]
+            return f(*args, **kwargs)
         
         try:
-            if token.startswith('Bearer '):
-                token = token[7:]
-            payload = jwt.decode(token, JWT_SECRET, algorithms=['HS256'])
+            payload = _jwt_decode(token, JWT_SECRET, algorithms=JWT_ALGORITHMS)
             request.user_id = payload.get('user_id')
+            # Cache entry must never outlive the token itself
+            expires_at = min(now + JWT_CACHE_TTL, payload.get('exp', now + JWT_CACHE_TTL))
+            with _jwt_cache_lock:
+                _jwt_cache[key] = (request.user_id, expires_at)
         except jwt.ExpiredSignatureError:
-            return jsonify({'error': 'Token has expired'}), 401
+            return json_response({'error': 'Token has expired'}, 401)
         except jwt.InvalidTokenError:
-            return jsonify({'error': 'Invalid token'}), 401
+            return json_response({'error': 'Invalid token'}, 401)
         
         return f(*args, **kwargs)
     return decorated_function
@@ -96,48 +211,48 @@ def require_auth(f):
 # Health Check
 @app.route('/health', methods=['GET'])
 def health_check():
-    return jsonify({'status': 'healthy', 'service': 'api-gateway'}), 200
+    return json_response({'status': 'healthy', 'service': 'api-gateway'}, 200)
 
 # ============= USER SERVICE ROUTES (REST) =============
 @app.route('/api/users/register', methods=['POST'])
 def register_user():
     try:
         response = circuit_breakers['user'].call(
-            requests.post,
+            user_session.post,
             f'{USER_SERVICE_URL}/api/users/register',
             json=request.json,
             timeout=5
         )
-        return jsonify(response.json()), response.status_code
+        return proxy_response(response)
     except Exception as e:
-        return jsonify({'error': f'User service unavailable: {str(e)}'}), 503
+        return json_response({'error': f'User service unavailable: {str(e)}'}, 503)
 
 @app.route('/api/users/login', methods=['POST'])
 def login_user():
     try:
         response = circuit_breakers['user'].call(
-            requests.post,
+            user_session.post,
             f'{USER_SERVICE_URL}/api/users/login',
             json=request.json,
             timeout=5
         )
-        return jsonify(response.json()), response.status_code
+        return proxy_response(response)
     except Exception as e:
-        return jsonify({'error': f'User service unavailable: {str(e)}'}), 503
+        return json_response({'error': f'User service unavailable: {str(e)}'}, 503)
 
 @app.route('/api/users/<user_id>', methods=['GET'])
 @require_auth
 def get_user(user_id):
     try:
         response = circuit_breakers['user'].call(
-            requests.get,
+            user_session.get,
             f'{USER_SERVICE_URL}/api/users/{user_id}',
             headers={'Authorization': request.headers.get('Authorization')},
             timeout=5
         )
-        return jsonify(response.json()), response.status_code
+        return proxy_response(response)
     except Exception as e:
-        return jsonify({'error': f'User service unavailable: {str(e)}'}), 503
+        return json_response({'error': f'User service unavailable: {str(e)}'}, 503)
 
 # ============= RESTAURANT SERVICE ROUTES (REST) =============
 @app.route('/api/restaurants', methods=['GET'])
@@ -145,48 +260,76 @@ def get_restaurants():
     try:
         params = request.args.to_dict()
         response = circuit_breakers['restaurant'].call(
-            requests.get,
+            restaurant_session.get,
             f'{RESTAURANT_SERVICE_URL}/api/restaurants',
             params=params,
             timeout=5
         )
-        return jsonify(response.json()), response.status_code
+        return proxy_response(response)
     except Exception as e:
-        return jsonify({'error': f'Restaurant service unavailable: {str(e)}'}), 503
+        return json_response({'error': f'Restaurant service unavailable: {str(e)}'}, 503)
 
 @app.route('/api/restaurants/<restaurant_id>', methods=['GET'])
 def get_restaurant(restaurant_id):
     try:
         response = circuit_breakers['restaurant'].call(
-            requests.get,
+            restaurant_session.get,
             f'{RESTAURANT_SERVICE_URL}/api/restaurants/{restaurant_id}',
             timeout=5
         )
-        return jsonify(response.json()), response.status_code
+        return proxy_response(response)
     except Exception as e:
-        return jsonify({'error': f'Restaurant service unavailable: {str(e)}'}), 503
+        return json_response({'error': f'Restaurant service unavailable: {str(e)}'}, 503)
 
 @app.route('/api/restaurants/<restaurant_id>/menu', methods=['GET'])
 def get_restaurant_menu(restaurant_id):
     try:
         response = circuit_breakers['restaurant'].call(
-            requests.get,
+            restaurant_session.get,
+            f'{RESTAURANT_SERVICE_URL}/api/restaurants/{restaurant_id}/menu',
+            timeout=5
+        )
+        return proxy_response(response)
+    except Exception as e:
+        return json_response({'error': f'Restaurant service unavailable: {str(e)}'}, 503)
+
+@app.route('/api/restaurants/<restaurant_id>/overview', methods=['GET'])
+def get_restaurant_overview(restaurant_id):
+    """Restaurant details and menu in one call - both fetched concurrently"""
+    try:
+        breaker = circuit_breakers['restaurant']
+        details_future = fanout_executor.submit(
+            breaker.call,
+            restaurant_session.get,
+            f'{RESTAURANT_SERVICE_URL}/api/restaurants/{restaurant_id}',
+            timeout=5
+        )
+        menu_future = fanout_executor.submit(
+            breaker.call,
+            restaurant_session.get,
             f'{RESTAURANT_SERVICE_URL}/api/restaurants/{restaurant_id}/menu',
             timeout=5
         )
-        return jsonify(response.json()), response.status_code
+        details = details_future.result()
+        menu = menu_future.result()
+        
+        if details.status_code != 200:
+            return proxy_response(details)
+        if menu.status_code != 200:
+            return proxy_response(menu)
+        
+        return json_response({
+            'restaurant': orjson.loads(details.content),
+            'menu_items': orjson.loads(menu.content).get('menu_items', [])
+        }, 200)
     except Exception as e:
-        return jsonify({'error': f'Restaurant service unavailable: {str(e)}'}), 503
+        return json_response({'error': f'Restaurant service unavailable: {str(e)}'}, 503)
 
 # ============= ORDER SERVICE ROUTES (gRPC) =============
 @app.route('/api/orders', methods=['POST'])
 @require_auth
 def create_order():
     try:
-        # Connect to gRPC service
-        channel = grpc.insecure_channel(ORDER_SERVICE_URL)
-        stub = order_pb2_grpc.OrderServiceStub(channel)
-        
         data = request.json
         order_request = order_pb2.CreateOrderRequest(
             user_id=str(request.user_id),
@@ -196,42 +339,39 @@ def create_order():
         )
         
         response = circuit_breakers['order'].call(
-            stub.CreateOrder,
+            _order_stub.CreateOrder,
             order_request,
             timeout=5
         )
         
-        return jsonify({
+        return json_response({
             'order_id': response.order_id,
             'status': response.status,
             'message': response.message
-        }), 201
+        }, 201)
     except Exception as e:
-        return jsonify({'error': f'Order service unavailable: {str(e)}'}), 503
+        return json_response({'error': f'Order service unavailable: {str(e)}'}, 503)
 
 @app.route('/api/orders/<order_id>', methods=['GET'])
 @require_auth
 def get_order(order_id):
     try:
-        channel = grpc.insecure_channel(ORDER_SERVICE_URL)
-        stub = order_pb2_grpc.OrderServiceStub(channel)
-        
         order_request = order_pb2.GetOrderRequest(order_id=order_id)
         response = circuit_breakers['order'].call(
-            stub.GetOrder,
+            _order_stub.GetOrder,
             order_request,
             timeout=5
         )
         
-        return jsonify({
+        return json_response({
             'order_id': response.order_id,
             'user_id': response.user_id,
             'restaurant_id': response.restaurant_id,
             'status': response.status,
             'total_amount': response.total_amount
-        }), 200
+        }, 200)
     except Exception as e:
-        return jsonify({'error': f'Order service unavailable: {str(e)}'}), 503
+        return json_response({'error': f'Order service unavailable: {str(e)}'}, 503)
 
 # ============= RECOMMENDATION SERVICE ROUTES (GraphQL) =============
 @app.route('/api/recommendations', methods=['POST'])
@@ -240,41 +380,103 @@ def get_recommendations():
     """Forward GraphQL query to recommendation service"""
     try:
         response = circuit_breakers['recommendation'].call(
-            requests.post,
+            recommendation_session.post,
             f'{RECOMMENDATION_SERVICE_URL}/graphql',
             json=request.json,
             timeout=5
         )
-        return jsonify(response.json()), response.status_code
+        return proxy_response(response)
     except Exception as e:
-        return jsonify({'error': f'Recommendation service unavailable: {str(e)}'}), 503
+        return json_response({'error': f'Recommendation service unavailable: {str(e)}'}, 503)
 
-# ============= RATE LIMITING (Simple Implementation) =============
-from collections import defaultdict
-import time
+# ============= RATE LIMITING =============
+from collections import deque
+import redis
 
-request_counts = defaultdict(list)
+REDIS_URL = os.getenv('REDIS_URL')
 RATE_LIMIT = 100  # requests per minute
 RATE_WINDOW = 60  # seconds
+RATE_LIMIT_EXEMPT_PATHS = frozenset(['/health', '/metrics'])  # probes and internal endpoints
+REDIS_RETRY_INTERVAL = 5  # seconds on the local limiter before trying Redis again
+
+# Shared fixed-window counters in Redis when configured, in-process fallback otherwise
+redis_client = None
+if REDIS_URL:
+    redis_client = redis.Redis(
+        connection_pool=redis.BlockingConnectionPool.from_url(REDIS_URL, max_connections=64)
+    )
+
+# While Redis is down: when to try it again (0 = healthy). Transitions are logged once each
+redis_retry_at = 0.0
+redis_state_lock = threading.Lock()
+
+# Bounded per-IP windows - idle clients age out, unique-IP floods evict LRU-first
+request_counts = TTLCache(maxsize=100_000, ttl=RATE_WINDOW * 2)
+request_counts_lock = threading.Lock()
+
+def redis_rate_limit(client_ip, current_time):
+    """Atomic fixed-window counter - INCR + EXPIRE in one round-trip"""
+    key = f"rl:{client_ip}:{int(current_time // RATE_WINDOW)}"
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.incr(key)
+    pipe.expire(key, RATE_WINDOW)
+    count, _ = pipe.execute()
+    return count > RATE_LIMIT
+
+def local_rate_limit(client_ip, current_time):
+    """Sliding-window counter kept in this process only"""
+    with request_counts_lock:
+        timestamps = request_counts.get(client_ip)
+        if timestamps is None:
+            timestamps = deque(maxlen=RATE_LIMIT)
+        # Re-insert to push the entry's expiry out while the client is active
+        request_counts[client_ip] = timestamps
+        
+        # Clean old requests - oldest are on the left
+        cutoff = current_time - RATE_WINDOW
+        while timestamps and timestamps[0] <= cutoff:
+            timestamps.popleft()
+        
+        # Check rate limit
+        if len(timestamps) >= RATE_LIMIT:
+            return True
+        
+        # Add current request
+        timestamps.append(current_time)
+        return False
 
 @app.before_request
 def rate_limit():
+    global redis_retry_at
+    # Probes and CORS preflights never count against a client
+    if request.method == 'OPTIONS' or request.path in RATE_LIMIT_EXEMPT_PATHS:
+        return
+    
     client_ip = request.remote_addr
     current_time = time.time()
     
-    # Clean old requests
-    request_counts[client_ip] = [
-        req_time for req_time in request_counts[client_ip]
-        if current_time - req_time < RATE_WINDOW
-    ]
-    
-    # Check rate limit
-    if len(request_counts[client_ip]) >= RATE_LIMIT:
-        return jsonify({'error': 'Rate limit exceeded'}), 429
+    limited = None
+    if redis_client is not None and current_time >= redis_retry_at:
+        try:
+            limited = redis_rate_limit(client_ip, current_time)
+        except redis.RedisError as e:
+            with redis_state_lock:
+                if redis_retry_at == 0.0:
+                    app.logger.warning('Redis rate limiter unavailable, using local limiter: %s', e)
+                redis_retry_at = current_time + REDIS_RETRY_INTERVAL
+        else:
+            if redis_retry_at:
+                with redis_state_lock:
+                    if redis_retry_at:
+                        app.logger.warning('Redis rate limiter recovered')
+                        redis_retry_at = 0.0
+    if limited is None:
+        limited = local_rate_limit(client_ip, current_time)
     
-    # Add current request
-    request_counts[client_ip].append(current_time)
+    if limited:
+        return json_response({'error': 'Rate limit exceeded'}, 429)
 
+# Development server only - containers run under gunicorn (see gunicorn.conf.py)
 if __name__ == '__main__':
     print("Starting API Gateway on port 8000...")
     print(f"User Service: {USER_SERVICE_URL}")
@@ -0,0 +1,12 @@
+"""
+Gunicorn configuration for the API Gateway
+Gateway handlers are I/O-bound proxies, so gevent workers overlap downstream latency
+"""
+
+import multiprocessing
+
+bind = '0.0.0.0:8000'
+workers = multiprocessing.cpu_count() * 2 + 1
+worker_class = 'gevent'
+worker_connections = 1000
+timeout = 30
@@ -0,0 +1,12 @@
+"""
+Gunicorn configuration for the Recommendation Service
+Resolvers block on MongoDB and release the GIL in numpy, so threaded workers overlap requests
+"""
+
+import multiprocessing
+
+bind = '0.0.0.0:5004'
+workers = min(multiprocessing.cpu_count(), 4)
+worker_class = 'gthread'
+threads = 8
+timeout = 30
@@ -0,0 +1,17 @@
+"""
+Gunicorn configuration for the Restaurant Service
+Handlers are short database reads, so gevent workers overlap PostgreSQL round-trips
+"""
+
+import multiprocessing
+
+bind = '0.0.0.0:5002'
+workers = multiprocessing.cpu_count() * 2 + 1
+worker_class = 'gevent'
+worker_connections = 1000
+timeout = 30
+
+def post_fork(server, worker):
+    # psycopg2 is a C driver - make it yield to the gevent hub instead of blocking the worker
+    from psycogreen.gevent import patch_psycopg
+    patch_psycopg()
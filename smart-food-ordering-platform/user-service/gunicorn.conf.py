@@ -0,0 +1,12 @@
+"""
+Gunicorn configuration for the User Service
+bcrypt is CPU-bound but releases the GIL, so threaded workers overlap hashing with other requests
+"""
+
+import multiprocessing
+
+bind = '0.0.0.0:5001'
+workers = multiprocessing.cpu_count() * 2 + 1
+worker_class = 'gthread'
+threads = 8
+timeout = 30